@@ -1,17 +1,36 @@
 #!/usr/bin/env python3
+import functools
+import hashlib
+import io
+import json
 import os
 import sys
 import tarfile
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 
 import boto3
-import base64
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from backup_format import (
+    FINAL_FRAME_AAD,
+    FRAME_AAD,
+    FRAME_INDEX,
+    FRAME_LENGTH,
+    HEADER_NONCE_SUFFIX,
+    MANIFEST_FORMAT,
+    MANIFEST_SUFFIX,
+    NONCE_PREFIX_SIZE,
+    FRAME_SIZE,
+    PLAINTEXT_LENGTH,
+    SALT_SIZE,
+    STREAM_MAGIC,
+    ChunkReader,
+)
 from logger_config import setup_logger
 from backup_db import backup_postgres
 from backup_data import backup_vaultwarden_data
@@ -33,6 +52,24 @@ MAX_BACKUPS_TO_KEEP = int(os.getenv("MAX_BACKUPS_TO_KEEP", "7"))
 BACKUP_SOURCE_DB = BACKUP_DIR / "db" / "vaultwarden.dump"
 BACKUP_SOURCE_DATA = BACKUP_DIR / "data"
 
+# tarfile copies member data in 16 KiB blocks by default; larger blocks mean
+# far fewer Python-level loop iterations and read/write syscalls per file.
+TAR_COPY_BUFSIZE = 2 * 1024 * 1024
+
+# A backup is a manifest plus separately encrypted database and data objects,
+# all named "<BACKUP_PREFIX><timestamp>.<suffix>". Older backups are a single
+# "<BACKUP_PREFIX><timestamp>.tar.gz.enc" archive.
+BACKUP_PREFIX = "vaultwarden-backup-"
+DB_OBJECT_SUFFIX = ".db.dump.enc"
+DATA_OBJECT_SUFFIX = ".data.tar.gz.enc"
+BACKUP_OBJECT_SUFFIXES = (MANIFEST_SUFFIX, DB_OBJECT_SUFFIX, ".tar.gz.enc")
+
+# Plaintext bytes per encrypted frame (the format itself is in backup_format.py)
+STREAM_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Each object is sent as a multipart upload with parts going up in parallel
+UPLOAD_TRANSFER_CONFIG = TransferConfig(max_concurrency=8)
+
 
 def check_dependencies() -> bool:
     """Check all required dependencies before starting backup."""
@@ -123,6 +160,20 @@ def check_dependencies() -> bool:
             logger.error(f"  [FAIL] {package:20s} - NOT INSTALLED")
             all_checks_passed = False
 
+    # Check 6: S3 bucket reachable with the configured credentials, so a bad key or
+    # bucket fails here instead of after the dump, copy and encrypt phases.
+    # Uses the same ListObjectsV2 permission the retention cleanup needs.
+    logger.info("\nChecking S3 bucket access...")
+    if all_checks_passed:
+        try:
+            get_s3_client().list_objects_v2(Bucket=S3_BUCKET, Prefix=BACKUP_PREFIX, MaxKeys=1)
+            logger.info(f"  [OK] S3 bucket accessible: {S3_BUCKET}")
+        except Exception as e:
+            logger.error(f"  [FAIL] S3 bucket not accessible: {S3_BUCKET} ({e})")
+            all_checks_passed = False
+    else:
+        logger.info("  [SKIP] Fix the failures above first")
+
     # Summary
     logger.info("\n" + "=" * 70)
     if all_checks_passed:
@@ -135,64 +186,161 @@ def check_dependencies() -> bool:
 
 
 def derive_key(password: str, salt: bytes) -> bytes:
-    """Derives a 32-byte URL-safe base64 key from the password using PBKDF2."""
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=480000,
-    )
-    return base64.urlsafe_b64encode(kdf.derive(password.encode()))
+    """Derives a raw 32-byte AES-256 key from the password using PBKDF2."""
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, 480000, dklen=32)
 
 
-def upload_to_s3(file_path: Path, object_name: str):
-    """Uploads the file to Cloudflare R2 (S3 Compatible)."""
-    s3_client = boto3.client(
+@functools.cache
+def get_s3_client():
+    """Creates the Cloudflare R2 (S3 Compatible) client once, shared by the pre-flight check, upload and cleanup."""
+    return boto3.client(
         's3',
         endpoint_url=S3_ENDPOINT,
         aws_access_key_id=AWS_ACCESS_KEY_ID,
         aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-        region_name=AWS_REGION
+        region_name=AWS_REGION,
+        # botocore already sets TCP_NODELAY; keepalive stops pooled connections
+        # from being silently dropped between the parts of a long upload. Both
+        # objects upload at once, so the pool must hold 2 x max_concurrency.
+        config=BotoConfig(tcp_keepalive=True, max_pool_connections=16),
     )
+
+
+def upload_to_s3(s3_client, fileobj, object_name: str):
+    """Uploads a readable stream to Cloudflare R2 (S3 Compatible)."""
     logger.info(f"Uploading {object_name} to {S3_BUCKET}...")
-    s3_client.upload_file(str(file_path), S3_BUCKET, object_name)
-    logger.info("Upload successful.")
+    s3_client.upload_fileobj(fileobj, S3_BUCKET, object_name, Config=UPLOAD_TRANSFER_CONFIG)
+    logger.info(f"Upload successful: {object_name}")
+
 
+def gcm_encryptor(key: bytes, nonce: bytes, aad: bytes):
+    """Starts an AES-256-GCM encryption; the tag is available after finalize()."""
+    encryptor = Cipher(algorithms.AES(key), modes.GCM(nonce)).encryptor()
+    encryptor.authenticate_additional_data(aad)
+    return encryptor
 
-def list_backup_files(s3_client) -> list:
-    """Lists all backup files in the S3 bucket, sorted by timestamp (oldest first)."""
+
+def iter_encrypted(src, salt: bytes):
+    """Yields the encrypted stream (header, then frames) for the open file src."""
+    nonce_prefix = os.urandom(NONCE_PREFIX_SIZE)
+    key = derive_key(BACKUP_PASSWORD, salt)
+
+    # Chunks are read and encrypted into these buffers, so a multi-GB object
+    # costs no per-frame allocations (update_into wants block size - 1 spare
+    # bytes). Reuse is safe: ChunkReader only resumes this generator once the
+    # previously yielded view has been fully copied out.
+    chunks = (bytearray(STREAM_CHUNK_SIZE), bytearray(STREAM_CHUNK_SIZE))
+    ciphertext = bytearray(STREAM_CHUNK_SIZE + 15)
+
+    plaintext_length = os.fstat(src.fileno()).st_size
+    header = (
+        STREAM_MAGIC + salt + nonce_prefix
+        + FRAME_SIZE.pack(STREAM_CHUNK_SIZE) + PLAINTEXT_LENGTH.pack(plaintext_length)
+    )
+    encryptor = gcm_encryptor(key, nonce_prefix + HEADER_NONCE_SUFFIX, header)
+    encryptor.finalize()
+    yield header + encryptor.tag
+
+    index = 0
+    total = 0
+    size = src.readinto(chunks[0])
+    while True:
+        total += size
+        # Read one chunk ahead so the final frame can be marked as such
+        next_size = src.readinto(chunks[(index + 1) % 2])
+        aad = FRAME_AAD if next_size else FINAL_FRAME_AAD
+        encryptor = gcm_encryptor(key, nonce_prefix + FRAME_INDEX.pack(index), aad)
+        written = encryptor.update_into(memoryview(chunks[index % 2])[:size], ciphertext)
+        encryptor.finalize()
+        yield FRAME_LENGTH.pack(written + len(encryptor.tag))
+        yield memoryview(ciphertext)[:written]
+        yield encryptor.tag
+        if not next_size:
+            break
+        size = next_size
+        index += 1
+
+    if total != plaintext_length:
+        raise RuntimeError(f"{src.name} changed size while it was being encrypted")
+
+
+def encrypt_and_upload(s3_client, source_path: Path, object_name: str) -> dict:
+    """Encrypts source_path with a fresh salt while uploading it, returns its manifest entry."""
+    logger.info(f"Encrypting {source_path.name} into {object_name}...")
+    with open(source_path, "rb") as src:
+        # Encrypted straight into the multipart upload; no ciphertext copy on disk
+        encrypted = ChunkReader(iter_encrypted(src, os.urandom(SALT_SIZE)))
+        upload_to_s3(s3_client, io.BufferedReader(encrypted, buffer_size=STREAM_CHUNK_SIZE), object_name)
+
+    size = encrypted.bytes_read
+    logger.info(f"Encryption completed: {object_name} ({size / (1024 * 1024):.2f} MB)")
+    return {"key": object_name, "size": size}
+
+
+def backup_db_object(s3_client, backup_id: str) -> dict:
+    """Encrypts and uploads the database dump as its own object."""
+    if not BACKUP_SOURCE_DB.exists():
+        raise FileNotFoundError(f"Database dump not found at {BACKUP_SOURCE_DB}")
+    return encrypt_and_upload(s3_client, BACKUP_SOURCE_DB, f"{backup_id}{DB_OBJECT_SUFFIX}")
+
+
+def backup_data_object(s3_client, backup_id: str) -> dict:
+    """Compresses, encrypts and uploads the data directory as its own object."""
+    if not BACKUP_SOURCE_DATA.exists():
+        raise FileNotFoundError(f"Data directory not found at {BACKUP_SOURCE_DATA}")
+
+    tar_path = SCRIPT_DIR / f"{backup_id}.data.tar.gz"
+    logger.info(f"Compressing data directory: {tar_path.name}")
+    with tarfile.open(tar_path, "w:gz", copybufsize=TAR_COPY_BUFSIZE) as tar:
+        tar.add(BACKUP_SOURCE_DATA, arcname="data")
+    logger.info(f"Compression completed ({tar_path.stat().st_size / (1024 * 1024):.2f} MB)")
+
+    return encrypt_and_upload(s3_client, tar_path, f"{backup_id}{DATA_OBJECT_SUFFIX}")
+
+
+def list_backups(s3_client) -> list:
+    """Lists all backups in the S3 bucket as (backup id, objects) pairs, oldest first."""
     try:
-        response = s3_client.list_objects_v2(Bucket=S3_BUCKET, Prefix="vaultwarden-backup-")
+        response = s3_client.list_objects_v2(Bucket=S3_BUCKET, Prefix=BACKUP_PREFIX)
 
         if 'Contents' not in response:
             return []
 
-        # Filter for encrypted backup files and sort by last modified date
-        backup_files = [
-            obj for obj in response['Contents']
-            if obj['Key'].startswith('vaultwarden-backup-') and obj['Key'].endswith('.tar.gz.enc')
-        ]
+        # Group the objects of each backup (manifest + db + data, or a single
+        # archive for older backups) under the id they share before the first dot
+        backups: dict[str, list] = {}
+        for obj in response['Contents']:
+            if obj['Key'].endswith(BACKUP_OBJECT_SUFFIXES):
+                backups.setdefault(obj['Key'].split('.', 1)[0], []).append(obj)
 
         # Sort by LastModified (oldest first)
-        backup_files.sort(key=lambda x: x['LastModified'])
-
-        return backup_files
+        return sorted(backups.items(), key=lambda item: max(obj['LastModified'] for obj in item[1]))
     except Exception as e:
         logger.error(f"Failed to list backup files: {e}")
         return []
 
 
+def delete_backup_objects(s3_client, keys: list[str]):
+    """Deletes the given objects from the S3 bucket, logging (not raising) failures."""
+    for key in keys:
+        try:
+            s3_client.delete_object(Bucket=S3_BUCKET, Key=key)
+            logger.info(f"Deleted: {key}")
+        except Exception as e:
+            logger.error(f"Failed to delete {key}: {e}")
+
+
 def delete_old_backups(s3_client):
     """Deletes old backups keeping only the latest MAX_BACKUPS_TO_KEEP versions."""
     logger.info(f"Checking for old backups (retention policy: keep last {MAX_BACKUPS_TO_KEEP})...")
 
-    backup_files = list_backup_files(s3_client)
+    backups = list_backups(s3_client)
 
-    if not backup_files:
+    if not backups:
         logger.info("No existing backups found in S3 bucket.")
         return
 
-    total_backups = len(backup_files)
+    total_backups = len(backups)
     logger.info(f"Found {total_backups} backup(s) in S3 bucket.")
 
     # Calculate how many to delete
@@ -205,20 +353,17 @@ def delete_old_backups(s3_client):
     logger.info(f"Deleting {backups_to_delete} old backup(s)...")
 
     # Delete oldest backups
-    for i in range(backups_to_delete):
-        backup_key = backup_files[i]['Key']
-        try:
-            s3_client.delete_object(Bucket=S3_BUCKET, Key=backup_key)
-            logger.info(f"Deleted old backup: {backup_key}")
-        except Exception as e:
-            logger.error(f"Failed to delete {backup_key}: {e}")
+    for backup_id, objects in backups[:backups_to_delete]:
+        logger.info(f"Deleting old backup: {backup_id}")
+        delete_backup_objects(s3_client, [obj['Key'] for obj in objects])
 
     logger.info(f"Retention cleanup completed. Kept {MAX_BACKUPS_TO_KEEP} most recent backup(s).")
 
 
 def main() -> int:
-    tar_path: Path | None = None
-    encrypted_path: Path | None = None
+    backup_id: str | None = None
+    s3_client = None
+    uploaded_keys: list[str] = []
     backup_successful = False
 
     try:
@@ -242,80 +387,64 @@ def main() -> int:
         logger.info("Data directory backup completed\n")
 
         timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d_%H-%M-%S_UTC")
-        tar_path = SCRIPT_DIR / f"vaultwarden-backup-{timestamp}.tar.gz"
-        encrypted_path = SCRIPT_DIR / f"vaultwarden-backup-{timestamp}.tar.gz.enc"
-
-        # Phase 3: Compress
-        logger.info("PHASE 3: Compressing backup archive...")
-        logger.info(f"Creating: {tar_path.name}")
-        with tarfile.open(tar_path, "w:gz") as tar:
-            if BACKUP_SOURCE_DB.exists():
-                tar.add(BACKUP_SOURCE_DB, arcname="vaultwarden.dump")
-            else:
-                raise FileNotFoundError(f"Database dump not found at {BACKUP_SOURCE_DB}")
-
-            if BACKUP_SOURCE_DATA.exists():
-                tar.add(BACKUP_SOURCE_DATA, arcname="data")
-            else:
-                raise FileNotFoundError(f"Data directory not found at {BACKUP_SOURCE_DATA}")
-
-        tar_size_mb = tar_path.stat().st_size / (1024 * 1024)
-        logger.info(f"Compression completed ({tar_size_mb:.2f} MB)\n")
-
-        # Phase 4: Encrypt
-        logger.info("PHASE 4: Encrypting backup archive...")
-        salt = os.urandom(16)
-        key = derive_key(BACKUP_PASSWORD, salt)
-        fernet = Fernet(key)
-
-        with open(tar_path, "rb") as f:
-            encrypted_data = fernet.encrypt(f.read())
-
-        with open(encrypted_path, "wb") as f:
-            f.write(salt + encrypted_data)
-
-        enc_size_mb = encrypted_path.stat().st_size / (1024 * 1024)
-        logger.info(f"Encryption completed ({enc_size_mb:.2f} MB)\n")
-
-        # Phase 5: Upload to S3
-        logger.info("PHASE 5: Uploading to S3...")
-        upload_to_s3(encrypted_path, encrypted_path.name)
-        logger.info("Upload completed\n")
+        backup_id = f"{BACKUP_PREFIX}{timestamp}"
+        manifest_key = f"{backup_id}{MANIFEST_SUFFIX}"
+
+        # Phase 3: Compress, encrypt and upload the database and data objects.
+        # They are independent, so both pipelines run (and upload) concurrently.
+        logger.info("PHASE 3: Encrypting and uploading backup objects...")
+        s3_client = get_s3_client()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            db_future = executor.submit(backup_db_object, s3_client, backup_id)
+            data_future = executor.submit(backup_data_object, s3_client, backup_id)
+            for future in (db_future, data_future):
+                if future.exception() is None:
+                    uploaded_keys.append(future.result()["key"])
+            objects = {"db": db_future.result(), "data": data_future.result()}
+        logger.info("Backup objects uploaded\n")
+
+        # Phase 4: Upload the manifest last, so its presence marks a complete backup
+        logger.info("PHASE 4: Uploading backup manifest...")
+        manifest = {"format": MANIFEST_FORMAT, "timestamp": timestamp, "objects": objects}
+        s3_client.put_object(
+            Bucket=S3_BUCKET,
+            Key=manifest_key,
+            Body=json.dumps(manifest, indent=2).encode(),
+            ContentType="application/json",
+        )
+        logger.info(f"Upload successful: {manifest_key}\n")
 
         # Mark backup as successful
         backup_successful = True
 
-        # Phase 6: Cleanup old backups (only if backup was successful)
-        logger.info("PHASE 6: Cleaning up old backups...")
-        s3_client = boto3.client(
-            's3',
-            endpoint_url=S3_ENDPOINT,
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-            region_name=AWS_REGION
-        )
+        # Phase 5: Cleanup old backups (only if backup was successful)
+        logger.info("PHASE 5: Cleaning up old backups...")
         delete_old_backups(s3_client)
 
         logger.info("\n" + "=" * 70)
         logger.info("BACKUP COMPLETED SUCCESSFULLY")
         logger.info("=" * 70)
-        logger.info(f"\nBackup file: {encrypted_path.name}")
-        logger.info(f"Original size: {tar_size_mb:.2f} MB")
-        logger.info(f"Encrypted size: {enc_size_mb:.2f} MB")
-        logger.info(f"Uploaded to: {S3_BUCKET}/{encrypted_path.name}")
+        logger.info(f"\nBackup manifest: {manifest_key}")
+        for name, entry in objects.items():
+            logger.info(f"  {name:5s}: {entry['key']} ({entry['size'] / (1024 * 1024):.2f} MB)")
+        logger.info(f"Uploaded to: {S3_BUCKET}")
         logger.info(f"Timestamp: {timestamp}\n")
 
         return 0
 
     except Exception as e:
         logger.critical(f"Backup process failed: {e}", exc_info=True)
+        if uploaded_keys and not backup_successful:
+            # Without a manifest these objects are not a usable backup
+            logger.info("Removing objects of the incomplete backup from S3...")
+            delete_backup_objects(s3_client, uploaded_keys)
         return 1
 
     finally:
         # Cleanup temporary files
         logger.info("Cleaning up local files...")
-        for path in [tar_path, encrypted_path]:
-            if path and path.exists():
+        if backup_id:
+            for path in SCRIPT_DIR.glob(f"{backup_id}.*"):
                 path.unlink()
                 logger.info(f"Removed {path.name}")
 
@@ -19,6 +19,10 @@ DB_TYPE = os.getenv("VAULTWARDEN_DB_TYPE")
 # Timeout for pg_dump in seconds (5 minutes should be plenty for most databases)
 PGDUMP_TIMEOUT = int(os.getenv("PGDUMP_TIMEOUT", "300"))
 
+# The dump is uploaded as its own object rather than inside the gzipped data
+# archive, so pg_dump does the compressing. Set PGDUMP_COMPRESS=0 to disable it.
+PGDUMP_COMPRESS = os.getenv("PGDUMP_COMPRESS", "6")
+
 
 def install_postgres_client():
     logger.info("Attempting to install PostgreSQL 16 client...")
@@ -50,6 +54,7 @@ def backup_postgres():
         "-p", os.getenv("VAULTWARDEN_DB_PORT", "5432"),
         "-U", os.getenv("VAULTWARDEN_DB_USERNAME", ""),
         "-F", "c",
+        f"--compress={PGDUMP_COMPRESS}",
         "-f", str(dump_file),
         os.getenv("VAULTWARDEN_DB_NAME", ""),
     ]
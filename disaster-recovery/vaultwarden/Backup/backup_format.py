@@ -0,0 +1,62 @@
+import io
+import struct
+
+# Backup layout and encryption format shared by backup.py and restore.py, so
+# both sides are always changed together.
+
+# A backup is "<id>.manifest.json" listing the separately encrypted database
+# and data objects; older backups are a single "<id>.tar.gz.enc" archive.
+MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_FORMAT = 1
+
+# Objects are encrypted with AES-256-GCM as a stream of frames so neither side
+# ever holds a whole archive in memory:
+#   MAGIC | salt(16) | nonce prefix(8) | u32 frame size | u64 plaintext length
+#   | header tag(16) | (u32 length | ciphertext + tag)*
+# The header tag authenticates everything before it (nonce = prefix | ffffffff),
+# so a wrong password or damaged header is caught before any frame. No frame
+# holds more than "frame size" plaintext bytes, which bounds a frame's length
+# prefix before it is trusted. Frame i uses nonce = prefix | u32 i and the
+# final frame is authenticated with different associated data, so reordered,
+# dropped or truncated frames fail to decrypt.
+STREAM_MAGIC = b"VWB\x03"
+SALT_SIZE = 16
+NONCE_PREFIX_SIZE = 8
+FRAME_SIZE = struct.Struct(">I")
+PLAINTEXT_LENGTH = struct.Struct(">Q")
+HEADER_NONCE_SUFFIX = b"\xff\xff\xff\xff"
+GCM_TAG_SIZE = 16
+FRAME_INDEX = struct.Struct(">I")
+FRAME_LENGTH = struct.Struct(">I")
+FRAME_AAD = b"\x00"
+FINAL_FRAME_AAD = b"\x01"
+
+
+class ChunkReader(io.RawIOBase):
+    """Read-only file object over an iterator of byte chunks, counting the bytes read."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._pending = memoryview(b"")
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        self.bytes_read += size
+        return size
+
+    def close(self):
+        # Stops a generator that is still mid-stream, e.g. an S3 download
+        if hasattr(self._chunks, "close"):
+            self._chunks.close()
+        super().close()
@@ -22,12 +22,20 @@ REMOTE MODE (--mode=remote):
 Perfect for 2AM disaster recovery! Clear, actionable logging at every step.
 """
 import argparse
+import functools
+import hashlib
+import io
+import itertools
+import json
 import os
 import shutil
 import subprocess
 import sys
 import tarfile
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
@@ -35,17 +43,73 @@ from typing import Optional
 import boto3
 import base64
 import docker
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import ReadTimeoutError, ResponseStreamingError
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from dotenv import load_dotenv
 
+from backup_format import (
+    FINAL_FRAME_AAD,
+    FRAME_AAD,
+    FRAME_INDEX,
+    FRAME_LENGTH,
+    FRAME_SIZE,
+    GCM_TAG_SIZE,
+    HEADER_NONCE_SUFFIX,
+    MANIFEST_FORMAT,
+    MANIFEST_SUFFIX,
+    NONCE_PREFIX_SIZE,
+    PLAINTEXT_LENGTH,
+    SALT_SIZE,
+    STREAM_MAGIC,
+    ChunkReader,
+)
 from logger_config import setup_logger
 
+try:
+    # ISA-L's SIMD inflate is several times faster than zlib's; same GzipFile API
+    from isal import igzip as gzip
+except ImportError:
+    import gzip
+
 CONTAINER_START_TIMEOUT = 30
 POSTGRES_READY_TIMEOUT = 60
 SSH_TIMEOUT = 30
 
+# The manifest and encrypted stream formats are defined in backup_format.py;
+# pre-manifest backups have no magic: a salt followed by a single Fernet token
+
+# tarfile pulls 10 KiB records from the gzip stream by default; bigger reads
+# cut the per-call overhead of the decrypt -> inflate -> untar pipeline
+EXTRACT_READ_BUFFER = 1024 * 1024
+EXTRACT_TAR_BUFSIZE = 512 * 1024
+
+# Small files are read from the archive in order but written to disk by a
+# thread pool; files above the size limit stream to disk in the main thread.
+# The reader stops once EXTRACT_READ_AHEAD_BYTES of file data await a writer.
+EXTRACT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+PARALLEL_EXTRACT_MAX_SIZE = 8 * 1024 * 1024
+EXTRACT_READ_AHEAD_BYTES = 64 * 1024 * 1024
+
+# Backup objects are fetched as parallel ranged GETs in 16 MiB parts, which
+# matters on high-latency links to R2 where one stream cannot fill the pipe
+DOWNLOAD_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=16,
+    io_chunksize=1024 * 1024,
+)
+
+# Manifest objects that are not on disk are streamed from S3 straight into
+# decryption and extraction: up to STREAM_PARTS_IN_FLIGHT ranged GETs run
+# ahead of the reader, which also bounds the memory held by the pipeline
+STREAM_PART_SIZE = 8 * 1024 * 1024
+STREAM_PARTS_IN_FLIGHT = 8
+STREAM_PART_ATTEMPTS = 3
+
 def log_section(title: str, char: str = "═"):
     """Helper to log major sections with clear visual separation."""
     logger.info("\n" + char * 70)
@@ -240,6 +304,15 @@ def check_dependencies(mode: str = "local") -> bool:
     
     # Check 5: Python packages
     log_subsection("Python Dependencies")
+    # Extraction relies on tarfile's filter= argument (no pre-3.12 fallback)
+    python_version = ".".join(map(str, sys.version_info[:3]))
+    if sys.version_info >= (3, 12):
+        logger.info(f"  ✅ {'python':20s} - {python_version}")
+    else:
+        logger.error(f"  ❌ {'python':20s} - {python_version} (3.12+ required)")
+        log_hint("Run with a newer interpreter, e.g.: uv run --python 3.12 restore.py")
+        all_checks_passed = False
+
     packages = ["boto3", "cryptography"]
     if mode == "local":
         packages.append("docker")
@@ -435,9 +508,9 @@ class RemoteOrchestrator:
     def wait_for_postgres_remote(self, timeout: int = POSTGRES_READY_TIMEOUT) -> bool:
         """Wait for PostgreSQL to be ready on remote server."""
         logger.info("  Waiting for remote PostgreSQL to be ready...")
-        start_time = time.time()
+        deadline = time.monotonic() + timeout
         
-        while time.time() - start_time < timeout:
+        while time.monotonic() < deadline:
             result = run_ssh_command(
                 f"PGPASSWORD='{DB_PASSWORD}' pg_isready -h {DB_HOST} -p {DB_PORT} -U {DB_USER}",
                 check_output=False,
@@ -587,12 +660,12 @@ class DockerOrchestrator:
     def wait_for_postgres(self, timeout: int = POSTGRES_READY_TIMEOUT) -> bool:
         """Wait for PostgreSQL to be ready to accept connections."""
         logger.info("Waiting for PostgreSQL to be ready...")
-        start_time = time.time()
+        deadline = time.monotonic() + timeout
+        env = os.environ.copy()
+        env["PGPASSWORD"] = DB_PASSWORD
 
-        while time.time() - start_time < timeout:
+        while time.monotonic() < deadline:
             try:
-                env = os.environ.copy()
-                env["PGPASSWORD"] = DB_PASSWORD
                 result = subprocess.run(
                     ["pg_isready", "-h", DB_HOST, "-p", DB_PORT, "-U", DB_USER],
                     env=env,
@@ -634,29 +707,45 @@ class DockerOrchestrator:
             return False
 
 
+# Every object has its own salt, so this only saves the 480k-iteration
+# derivation when the same object is decrypted again within one run
+@functools.lru_cache(maxsize=16)
 def derive_key(password: str, salt: bytes) -> bytes:
-    """Derives a 32-byte URL-safe base64 key from the password using PBKDF2."""
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=480000,
+    """Derives a raw 32-byte key from the password using PBKDF2."""
+    # Runs the whole PBKDF2 loop in C (OpenSSL via hashlib)
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, 480000, dklen=32)
+
+
+def derive_fernet_key(password: str, salt: bytes) -> bytes:
+    """Derives the URL-safe base64 Fernet key; only pre-manifest backups (salt + single token) use it."""
+    return base64.urlsafe_b64encode(derive_key(password, salt))
+
+
+@functools.cache
+def get_s3_client():
+    """Creates the Cloudflare R2 / S3 client once, so every download reuses its connection pool."""
+    return boto3.client(
+        's3',
+        endpoint_url=S3_ENDPOINT,
+        aws_access_key_id=AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+        region_name=AWS_REGION,
+        # The pool must cover DOWNLOAD_TRANSFER_CONFIG.max_concurrency, or
+        # ranged GETs queue for a connection; adaptive retries ride out R2 throttling.
+        config=BotoConfig(
+            max_pool_connections=32,
+            tcp_keepalive=True,
+            retries={"mode": "adaptive", "max_attempts": 10},
+        ),
     )
-    return base64.urlsafe_b64encode(kdf.derive(password.encode()))
 
 
 def download_from_s3(object_name: str, local_path: Path) -> bool:
     """Downloads the file from Cloudflare R2 / S3."""
     try:
-        s3_client = boto3.client(
-            's3',
-            endpoint_url=S3_ENDPOINT,
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-            region_name=AWS_REGION
-        )
+        s3_client = get_s3_client()
         logger.info(f"Downloading {object_name} from {S3_BUCKET}...")
-        s3_client.download_file(S3_BUCKET, object_name, str(local_path))
+        s3_client.download_file(S3_BUCKET, object_name, str(local_path), Config=DOWNLOAD_TRANSFER_CONFIG)
         logger.info("Download successful.")
         return True
     except Exception as e:
@@ -664,25 +753,117 @@ def download_from_s3(object_name: str, local_path: Path) -> bool:
         return False
 
 
-def decrypt_backup(encrypted_path: Path, output_path: Path) -> bool:
-    """Reads salt, derives key, and decrypts the file."""
+def read_frame_length(src) -> int:
+    """Reads a frame's length prefix, failing if the stream ends before the final frame."""
+    length = src.read(FRAME_LENGTH.size)
+    if len(length) < FRAME_LENGTH.size:
+        raise ValueError("encrypted stream is truncated")
+    return FRAME_LENGTH.unpack(length)[0]
+
+
+def gcm_decryptor(key: bytes, nonce: bytes, tag: bytes, aad: bytes):
+    """Starts an AES-256-GCM decryption; finalize() raises InvalidTag on a bad tag."""
+    decryptor = Cipher(algorithms.AES(key), modes.GCM(nonce, tag)).decryptor()
+    decryptor.authenticate_additional_data(aad)
+    return decryptor
+
+
+def decrypt_frame_into(key: bytes, nonce: bytes, frame: memoryview, aad: bytes, out: bytearray) -> memoryview:
+    """Decrypts a ciphertext + tag frame into out, raising InvalidTag before returning anything."""
+    decryptor = gcm_decryptor(key, nonce, bytes(frame[-GCM_TAG_SIZE:]), aad)
+    size = decryptor.update_into(frame[:-GCM_TAG_SIZE], out)
+    decryptor.finalize()
+    return memoryview(out)[:size]
+
+
+def iter_decrypted_gcm(src):
+    """Yields the plaintext of AES-GCM frames, verifying each tag before it is used."""
+    salt = src.read(SALT_SIZE)
+    nonce_prefix = src.read(NONCE_PREFIX_SIZE)
+    key = derive_key(BACKUP_PASSWORD, salt)
+
+    frame_size = src.read(FRAME_SIZE.size)
+    length = src.read(PLAINTEXT_LENGTH.size)
+    # A wrong password or damaged header fails here, before any frame is read
+    header = STREAM_MAGIC + salt + nonce_prefix + frame_size + length
+    gcm_decryptor(key, nonce_prefix + HEADER_NONCE_SUFFIX, src.read(GCM_TAG_SIZE), header).finalize()
+    max_frame_length = FRAME_SIZE.unpack(frame_size)[0] + GCM_TAG_SIZE
+    expected_length = PLAINTEXT_LENGTH.unpack(length)[0]
+
+    # Every frame is read and decrypted into the same two buffers, so the
+    # yielded views are only valid until the next frame is requested
+    frame_buffer = bytearray()
+    plaintext_buffer = bytearray()
+    index = 0
+    total = 0
+    final = False
+    while not final:
+        length = read_frame_length(src)
+        # Length prefixes are not authenticated, so check them before allocating
+        if not GCM_TAG_SIZE <= length <= max_frame_length:
+            raise ValueError(f"frame {index} has an invalid length of {length} bytes")
+        if length > len(frame_buffer):
+            frame_buffer = bytearray(length)
+            # update_into wants block size - 1 spare bytes
+            plaintext_buffer = bytearray(length + 15)
+        frame = memoryview(frame_buffer)[:length]
+        if src.readinto(frame) < length:
+            raise ValueError("encrypted stream is truncated")
+
+        nonce = nonce_prefix + FRAME_INDEX.pack(index)
+        try:
+            plaintext = decrypt_frame_into(key, nonce, frame, FRAME_AAD, plaintext_buffer)
+        except InvalidTag:
+            # The final frame only authenticates with the final-frame data
+            plaintext = decrypt_frame_into(key, nonce, frame, FINAL_FRAME_AAD, plaintext_buffer)
+            final = True
+        total += len(plaintext)
+        yield plaintext
+        index += 1
+
+    if total != expected_length:
+        raise ValueError(f"decrypted {total} bytes but the header records {expected_length}")
+
+
+def iter_decrypted(src):
+    """Yields the plaintext of an open encrypted backup file, one frame at a time."""
+    magic = src.read(len(STREAM_MAGIC))
+    if magic == STREAM_MAGIC:
+        yield from iter_decrypted_gcm(src)
+    else:
+        # Single-token format: the whole file has to be decrypted at once
+        salt = magic + src.read(SALT_SIZE - len(magic))
+        yield Fernet(derive_fernet_key(BACKUP_PASSWORD, salt)).decrypt(src.read())
+        return
+    if src.read(1):
+        raise ValueError("unexpected data after the final frame")
+
+
+def decrypt_backup(src, output_path: Path, encrypted_size: int) -> bool:
+    """Reads salt, derives key, and decrypts the open encrypted object into output_path."""
     if not BACKUP_PASSWORD:
         logger.critical("BACKUP_PASSWORD environment variable is missing!")
         raise ValueError("BACKUP_PASSWORD environment variable is missing!")
 
-    logger.info(f"Decrypting {encrypted_path}...")
+    logger.info(f"Decrypting to {output_path}...")
 
     try:
-        with open(encrypted_path, "rb") as f:
-            salt = f.read(16)
-            encrypted_data = f.read()
-
-        key = derive_key(BACKUP_PASSWORD, salt)
-        fernet = Fernet(key)
-        decrypted_data = fernet.decrypt(encrypted_data)
-
-        with open(output_path, "wb") as f:
-            f.write(decrypted_data)
+        fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        # Unbuffered: each decrypted frame goes straight to write(2) without
+        # another copy through a BufferedWriter
+        with open(fd, "wb", buffering=0) as dst:
+            # The plaintext is never larger than the ciphertext, so reserving that
+            # much up front avoids growing the file extent by extent
+            if hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(fd, 0, encrypted_size)
+                except OSError:
+                    pass  # Not supported by every filesystem; only an optimization
+            for chunk in iter_decrypted(src):
+                view = memoryview(chunk)
+                while view:
+                    view = view[dst.write(view):]
+            dst.truncate()
 
         logger.info(f"Decryption successful: {output_path}")
         return True
@@ -691,52 +872,293 @@ def decrypt_backup(encrypted_path: Path, output_path: Path) -> bool:
         return False
 
 
-def safe_extract_filter(member: tarfile.TarInfo, path: str) -> tarfile.TarInfo | None:
-    """Filter for tar extraction to prevent path traversal attacks."""
-    if member.name.startswith('/') or member.name.startswith('\\'):
-        logger.warning(f"Skipping absolute path in archive: {member.name}")
-        return None
+def make_extract_filter(root: str):
+    """Builds the tar extraction filter that keeps every member inside the resolved root."""
+    # Until the archive has produced a symlink, nothing under the root can
+    # redirect a path, so plain string checks are enough. After that, a link
+    # that was checked while its target did not exist yet may since have been
+    # redirected by a later link, so every member is resolved with realpath
+    # (as tarfile.data_filter does).
+    root_prefix = root + os.sep
+    symlink_seen = False
+
+    def is_inside_root(path: str) -> bool:
+        return path == root or path.startswith(root_prefix)
+
+    def safe_extract_filter(member: tarfile.TarInfo, path: str) -> tarfile.TarInfo | None:
+        """Filter for tar extraction to prevent path traversal attacks."""
+        if member.name.startswith('/') or member.name.startswith('\\'):
+            logger.warning(f"Skipping absolute path in archive: {member.name}")
+            return None
+
+        if '..' in member.name:
+            logger.warning(f"Skipping path traversal attempt in archive: {member.name}")
+            return None
 
-    if '..' in member.name:
-        logger.warning(f"Skipping path traversal attempt in archive: {member.name}")
-        return None
+        nonlocal symlink_seen
+        dest_path = os.path.normpath(os.path.join(root, member.name))
+        if symlink_seen:
+            if member.issym() or member.islnk():
+                # An existing file at a link's path is replaced, not followed
+                resolved = os.path.join(os.path.realpath(os.path.dirname(dest_path)), os.path.basename(dest_path))
+            else:
+                resolved = os.path.realpath(dest_path)
+        else:
+            resolved = dest_path
+        if not is_inside_root(resolved):
+            logger.warning(f"Skipping file that would extract outside target: {member.name}")
+            return None
 
-    dest_path = Path(path) / member.name
+        if member.issym() or member.islnk():
+            # Links are rare, so they get the symlink-following check
+            base = os.path.dirname(dest_path) if member.issym() else root
+            if not is_inside_root(os.path.realpath(os.path.join(base, member.linkname))):
+                logger.warning(f"Skipping link that points outside target: {member.name} -> {member.linkname}")
+                return None
+            if member.issym():
+                symlink_seen = True
+
+        return member
+
+    return safe_extract_filter
+
+
+def write_member(tar: tarfile.TarFile, member: tarfile.TarInfo, data: bytes, dest_path: str):
+    """Writes a regular file's data and applies its owner, mode and mtime."""
+    with open(dest_path, "wb") as f:
+        f.write(data)
+    tar.chown(member, dest_path, numeric_owner=False)
+    tar.chmod(member, dest_path)
+    tar.utime(member, dest_path)
+
+
+class ByteBudget:
+    """Blocks acquire() while the bytes held by earlier acquires exceed the limit."""
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._used = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size: int):
+        with self._condition:
+            # A single request larger than the limit still goes through once nothing else is held
+            self._condition.wait_for(lambda: self._used == 0 or self._used + size <= self._limit)
+            self._used += size
+
+    def release(self, size: int):
+        with self._condition:
+            self._used -= size
+            self._condition.notify_all()
+
+
+def extract_members(tar: tarfile.TarFile, root: str):
+    """Extracts a stream-mode archive into the resolved root, writing small files in parallel."""
+    extract_filter = make_extract_filter(root)
+    directories = []
+    pending = []
+    # Parent directories already created, so makedirs runs once per directory
+    # rather than once per file
+    created_dirs = {root}
+    # Caps the file data read ahead of the writers, in bytes
+    read_ahead = ByteBudget(EXTRACT_READ_AHEAD_BYTES)
+    # First write error, so the archive stops streaming as soon as a write fails
+    failures = []
+
+    def finish_write(size: int, future):
+        read_ahead.release(size)
+        if not future.cancelled() and future.exception() is not None:
+            failures.append(future.exception())
+
+    executor = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS)
     try:
-        dest_path.resolve().relative_to(Path(path).resolve())
-    except ValueError:
-        logger.warning(f"Skipping file that would extract outside target: {member.name}")
-        return None
+        for member in tar:
+            if failures:
+                raise failures[0]
+            member = extract_filter(member, root)
+            if member is None:
+                continue
+
+            if member.isreg() and member.size <= PARALLEL_EXTRACT_MAX_SIZE:
+                dest_path = os.path.join(root, member.name)
+                parent = os.path.dirname(dest_path)
+                if parent not in created_dirs:
+                    os.makedirs(parent, exist_ok=True)
+                    created_dirs.add(parent)
+                read_ahead.acquire(member.size)
+                try:
+                    data = tar.extractfile(member).read()
+                    future = executor.submit(write_member, tar, member, data, dest_path)
+                except BaseException:
+                    read_ahead.release(member.size)
+                    raise
+                future.add_done_callback(functools.partial(finish_write, member.size))
+                pending.append(future)
+                continue
+
+            if member.islnk() or member.issym():
+                # A hardlink's target may still be queued for writing, and a
+                # queued write must not land after a symlink replaces its path
+                wait(pending)
+                if failures:
+                    raise failures[0]
+            if member.isdir():
+                directories.append(member)
+            # Already filtered above; directory attributes are set once their contents exist
+            tar.extract(member, root, set_attrs=not member.isdir(), filter="fully_trusted")
+
+        wait(pending)
+        if failures:
+            raise failures[0]
+    finally:
+        # After a failure the writes still queued are dropped rather than run
+        executor.shutdown(cancel_futures=True)
 
-    return member
+    # Same as extractall: deepest directories first, so parents keep their mtime
+    for member in sorted(directories, key=lambda m: m.name, reverse=True):
+        dir_path = os.path.join(root, member.name)
+        tar.chown(member, dir_path, numeric_owner=False)
+        tar.utime(member, dir_path)
+        tar.chmod(member, dir_path)
 
 
-def extract_archive(tar_path: Path, extract_to: Path) -> bool:
-    """Extracts the tar.gz archive safely."""
-    logger.info(f"Extracting {tar_path} to {extract_to}...")
+def extract_archive(src, extract_to: Path) -> bool:
+    """Decrypts and extracts an encrypted tar.gz in one pass, without writing the archive to disk."""
+    if not BACKUP_PASSWORD:
+        logger.critical("BACKUP_PASSWORD environment variable is missing!")
+        raise ValueError("BACKUP_PASSWORD environment variable is missing!")
+
+    logger.info(f"Extracting to {extract_to}...")
     try:
         if extract_to.exists():
             shutil.rmtree(extract_to)
         extract_to.mkdir(parents=True, exist_ok=True)
 
-        with tarfile.open(tar_path, "r:gz") as tar:
-            try:
-                tar.extractall(path=extract_to, filter=safe_extract_filter)
-            except TypeError:
-                # Python < 3.12 fallback
-                safe_members = []
-                for member in tar.getmembers():
-                    if safe_extract_filter(member, str(extract_to)) is not None:
-                        safe_members.append(member)
-                tar.extractall(path=extract_to, members=safe_members)
+        chunks = iter_decrypted(src)
+        # Stream mode ("r|") reads the archive strictly front to back,
+        # so the decrypted stream never needs to be seekable
+        stream = io.BufferedReader(ChunkReader(chunks), buffer_size=EXTRACT_READ_BUFFER)
+        with gzip.GzipFile(fileobj=stream) as gz, \
+                tarfile.open(fileobj=gz, mode="r|", bufsize=EXTRACT_TAR_BUFSIZE) as tar:
+            extract_members(tar, os.path.realpath(extract_to))
+        # tar stops reading at its end-of-archive marker; still
+        # authenticate whatever frames are left
+        for _ in chunks:
+            pass
 
         logger.info("Extraction successful.")
         return True
+    except (InvalidTag, InvalidToken):
+        logger.error("Decryption failed (Wrong password?)")
+        log_hint("Verify BACKUP_PASSWORD is correct")
+        return False
     except Exception as e:
         logger.error(f"Extraction failed: {e}")
         return False
 
 
+def unpack_archive(src, extract_to: Path) -> bool:
+    """Decrypts and extracts an open encrypted .tar.gz straight into extract_to."""
+    logger.info("🔓 Decrypting and extracting archive...")
+    if not extract_archive(src, extract_to):
+        return False
+    logger.info("✅ Extraction successful\n")
+    return True
+
+
+def fetch_part(object_name: str, start: int, end: int) -> bytes:
+    """Downloads bytes start..end (inclusive) of an S3 object, retrying broken streams."""
+    for attempt in range(1, STREAM_PART_ATTEMPTS + 1):
+        try:
+            response = get_s3_client().get_object(Bucket=S3_BUCKET, Key=object_name, Range=f"bytes={start}-{end}")
+            return response["Body"].read()
+        except (ResponseStreamingError, ReadTimeoutError):
+            if attempt == STREAM_PART_ATTEMPTS:
+                raise
+
+
+def iter_s3_object(object_name: str, size: int):
+    """Yields an S3 object's bytes in order while later parts download in the background."""
+    starts = iter(range(0, size, STREAM_PART_SIZE))
+    with ThreadPoolExecutor(max_workers=STREAM_PARTS_IN_FLIGHT) as executor:
+        def submit(start: int):
+            return executor.submit(fetch_part, object_name, start, min(start + STREAM_PART_SIZE, size) - 1)
+
+        in_flight = deque(submit(start) for start in itertools.islice(starts, STREAM_PARTS_IN_FLIGHT))
+        try:
+            while in_flight:
+                part = in_flight.popleft().result()
+                start = next(starts, None)
+                if start is not None:
+                    in_flight.append(submit(start))
+                yield part
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+
+def open_backup_object(object_name: str, local_path: Path):
+    """Opens local_path if it exists, otherwise a stream of object_name from S3. Returns (file, size)."""
+    if local_path.exists():
+        size = local_path.stat().st_size
+        logger.info(f"  ✅ Found local file: {local_path.name} ({size / (1024 * 1024):.2f} MB)")
+        return open(local_path, "rb"), size
+
+    size = get_s3_client().head_object(Bucket=S3_BUCKET, Key=object_name)["ContentLength"]
+    logger.info(f"  📥 {local_path.name} not found locally, streaming from S3 ({size / (1024 * 1024):.2f} MB)")
+    stream = ChunkReader(iter_s3_object(object_name, size))
+    return io.BufferedReader(stream, buffer_size=STREAM_PART_SIZE), size
+
+
+def unpack_backup(backup_file: Path, extract_to: Path) -> bool:
+    """
+    Decrypts and extracts a backup into extract_to as vaultwarden.dump + data/.
+
+    backup_file is either a manifest (.manifest.json) listing the separately
+    encrypted database and data objects, or a single encrypted .tar.gz archive
+    holding both (backups made before the manifest layout).
+    """
+    if not backup_file.name.endswith(MANIFEST_SUFFIX):
+        with open(backup_file, "rb") as src:
+            return unpack_archive(src, extract_to)
+
+    try:
+        manifest = json.loads(backup_file.read_text())
+        db_key = manifest["objects"]["db"]["key"]
+        data_key = manifest["objects"]["data"]["key"]
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Cannot read backup manifest {backup_file}: {e}")
+        return False
+    if manifest.get("format") != MANIFEST_FORMAT:
+        logger.error(f"Unsupported backup manifest format: {manifest.get('format')}")
+        return False
+
+    # Both objects are opened (HEAD only, for S3) before anything is extracted
+    logger.info("📥 Locating backup objects...")
+    sources = []
+    try:
+        for key in (data_key, db_key):
+            sources.append(open_backup_object(key, backup_file.parent / key))
+    except Exception as e:
+        for src, _ in sources:
+            src.close()
+        logger.error(f"❌ Could not find all backup objects locally or in S3: {e}")
+        return False
+    (data_src, _), (db_src, db_size) = sources
+
+    with data_src, db_src:
+        # Data first: extract_archive starts from an empty extract_to
+        if not unpack_archive(data_src, extract_to):
+            return False
+
+        logger.info("🔓 Decrypting database dump...")
+        if not decrypt_backup(db_src, extract_to / "vaultwarden.dump", db_size):
+            log_hint("Verify BACKUP_PASSWORD is correct")
+            return False
+    logger.info("✅ Database dump decrypted\n")
+    return True
+
+
 def restore_postgres_database(dump_file: Path) -> bool:
     """Restore PostgreSQL database from dump file using pg_restore."""
     if not dump_file.exists():
@@ -885,11 +1307,6 @@ def main_local(backup_filename: str) -> int:
         backup_file = SCRIPT_DIR / backup_filename
 
     local_encrypted_file = backup_file
-    decrypted_tar_file = (
-        backup_file.with_suffix('').with_suffix('.tar.gz')
-        if backup_file.suffix == '.enc'
-        else backup_file.parent / backup_file.name.replace('.enc', '')
-    )
 
     docker_orchestrator: DockerOrchestrator | None = None
 
@@ -914,16 +1331,8 @@ def main_local(backup_filename: str) -> int:
 
         log_section("PHASE 2: DECRYPTING AND EXTRACTING BACKUP", "═")
 
-        logger.info("🔓 Decrypting backup...")
-        if not decrypt_backup(local_encrypted_file, decrypted_tar_file):
-            return 1
-        decrypted_size_mb = decrypted_tar_file.stat().st_size / (1024 * 1024)
-        logger.info(f"✅ Decryption successful ({decrypted_size_mb:.2f} MB)\n")
-
-        logger.info("📦 Extracting archive...")
-        if not extract_archive(decrypted_tar_file, RESTORE_TEMP):
+        if not unpack_backup(local_encrypted_file, RESTORE_TEMP):
             return 1
-        logger.info("✅ Extraction successful\n")
 
         # Verify extracted contents
         logger.info("🔍 Verifying backup contents...")
@@ -1050,7 +1459,7 @@ def main_local(backup_filename: str) -> int:
     finally:
         # Cleanup temporary files
         logger.info("\n🧹 Cleaning up temporary files...")
-        cleanup_temp_files(decrypted_tar_file, RESTORE_TEMP)
+        cleanup_temp_files(RESTORE_TEMP)
 
 
 def main_remote(backup_filename: str) -> int:
@@ -1071,11 +1480,6 @@ def main_remote(backup_filename: str) -> int:
         backup_file = SCRIPT_DIR / backup_filename
 
     local_encrypted_file = backup_file
-    decrypted_tar_file = (
-        backup_file.with_suffix('').with_suffix('.tar.gz')
-        if backup_file.suffix == '.enc'
-        else backup_file.parent / backup_file.name.replace('.enc', '')
-    )
 
     remote_orchestrator: RemoteOrchestrator | None = None
 
@@ -1102,19 +1506,9 @@ def main_remote(backup_filename: str) -> int:
 
         log_section("PHASE 2: DECRYPTING AND EXTRACTING BACKUP (LOCAL)", "═")
 
-        logger.info("🔓 Decrypting backup...")
-        if not decrypt_backup(local_encrypted_file, decrypted_tar_file):
-            logger.error("❌ Decryption failed")
-            log_hint("Verify BACKUP_PASSWORD is correct")
-            return 1
-        decrypted_size_mb = decrypted_tar_file.stat().st_size / (1024 * 1024)
-        logger.info(f"✅ Decryption successful ({decrypted_size_mb:.2f} MB)\n")
-
-        logger.info("📦 Extracting archive...")
-        if not extract_archive(decrypted_tar_file, RESTORE_TEMP):
-            logger.error("❌ Extraction failed")
+        if not unpack_backup(local_encrypted_file, RESTORE_TEMP):
+            logger.error("❌ Decryption or extraction failed")
             return 1
-        logger.info("✅ Extraction successful\n")
 
         # Verify extracted contents
         logger.info("🔍 Verifying backup contents...")
@@ -1294,7 +1688,7 @@ def main_remote(backup_filename: str) -> int:
     finally:
         # Cleanup temporary files
         logger.info("\n🧹 Cleaning up temporary files...")
-        cleanup_temp_files(decrypted_tar_file, RESTORE_TEMP)
+        cleanup_temp_files(RESTORE_TEMP)
         if remote_orchestrator:
             remote_orchestrator.cleanup_remote(REMOTE_TEMP_DIR)
 
@@ -1331,6 +1725,7 @@ if __name__ == "__main__":
         epilog="""
 Examples:
   # Local Docker-based recovery (default):
+  python restore.py vaultwarden-backup-2025-12-27_04-41-23_UTC.manifest.json
   python restore.py vaultwarden-backup-2025-12-27_04-41-23_UTC.tar.gz.enc
   python restore.py /path/to/backup.tar.gz.enc
   
@@ -1376,7 +1771,7 @@ Each step shows ✅, ❌, or ⚠️  with helpful hints 💡 when things go wron
     
     parser.add_argument(
         "backup_file",
-        help="Path to encrypted backup file (.tar.gz.enc)"
+        help="Backup manifest (.manifest.json) or encrypted backup archive (.tar.gz.enc)"
     )
     
     parser.add_argument(